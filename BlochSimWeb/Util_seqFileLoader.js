@@ -77,6 +77,42 @@ class Definitions {
     }
 }
 
+// Expands the run-length encoded derivative of a shape and integrates it in a
+// single pass. Two equal values in a row are followed by the number of
+// additional repetitions, which is not part of the derivative itself.
+// Shapes that store as many values as samples are not compressed at all.
+function decompressShape(id, compressed, count) {
+    if (compressed.length == count) {
+        return compressed;
+    }
+    let res = new Float64Array(count);
+    let pos = 0;
+    let value = 0;
+    let i = 0;
+
+    while (i < compressed.length) {
+        let deriv = compressed[i];
+        let repeat = 1;
+        if (i < compressed.length - 2 && deriv == compressed[i + 1]) {
+            repeat = compressed[i + 2] + 2;
+            i += 3;
+        } else {
+            i += 1;
+        }
+        if (pos + repeat > count) {
+            throw `Shape with id ${id} decompresses to more than ${count} samples`;
+        }
+        for (let end = pos + repeat; pos < end; pos++) {
+            value += deriv;
+            res[pos] = value;
+        }
+    }
+    if (pos != count) {
+        throw `Shape with id ${id} decompresses to ${pos} samples, expected ${count}`;
+    }
+    return res;
+}
+
 class Shapes {
     constructor(lines) {
         this.shapes = {};
@@ -99,42 +135,9 @@ class Shapes {
                 shape.samples.push(parseFloat(line));
             }
         }
-        for (var key in this.shapes)
-        {
+        for (let key in this.shapes) {
             let shape = this.shapes[key];
-            let temp = [];
-            // compression back to derivative
-            for (let idx = 0; idx < shape.samples.length; idx++)
-            {
-                let value = shape.samples[idx];
-                if (temp.length >= 2 )
-                {
-                    if (shape.samples[idx-1] == shape.samples[idx-2])
-                    {
-                        for (let i = 0; i < value; i++)
-                        {
-                            temp.push(shape.samples[idx-1])
-                        }
-                    }
-                    else
-                    {
-                        temp.push(value);
-                    }
-                }
-                else
-                {
-                    temp.push(value);
-                }
-            }
-            // derivative back to shape
-            let res = [];
-            let temp_value = 0;
-            for (let i=0; i<temp.length; i+=1)
-            {
-                temp_value +=  temp[i];
-                res.push(temp_value)
-            }
-            shape.samples = res;
+            shape.samples = decompressShape(key, shape.samples, shape.count);
         }
     }
 
@@ -170,6 +173,11 @@ class Shapes {
 class IdSection {
     constructor(lines, sec_def) {
         this.sec_def = sec_def;
+        this.parse(lines);
+    }
+
+    parse(lines) {
+        let sec_def = this.sec_def;
         this.events = {};
 
         for (let line of lines) {
@@ -236,6 +244,53 @@ class Blocks extends IdSection {
             // ["ext", (x) => parseInt(x, 10), "ID of extension table entry"],
         ]);
     }
+
+    // Sequences can contain hundreds of thousands of blocks, so instead of
+    // one object per block, all IDs are stored in a flat table with one row
+    // of [id, delay, rf, gx, gy, gz, adc] per block, in file order.
+    parse(lines) {
+        const width = this.sec_def.length + 1;
+        this.count = lines.length;
+        this.table = new Int32Array(this.count * width);
+        this._events = null;
+
+        let ids = new Set();
+        for (let row = 0; row < this.count; row++) {
+            const vals = lines[row].split(" ").filter((x) => x.length > 0);
+            if (vals.length != width) {
+                throw `Expected ${width} IDs per event, found ${vals.length}`;
+            }
+            for (let i = 0; i < width; i++) {
+                const id = parseInt(vals[i], 10);
+                if (!Number.isInteger(id)) {
+                    throw `Invalid ID "${vals[i]}" in block "${lines[row]}"`;
+                }
+                this.table[row * width + i] = id;
+            }
+            const id = this.table[row * width];
+            if (ids.has(id)) {
+                throw `Event with ID ${id} is defined more than once`;
+            }
+            ids.add(id);
+        }
+    }
+
+    // Object view {id: {delay, rf, ...}} like the other sections, only built
+    // when accessed (e.g. for display)
+    get events() {
+        if (this._events === null) {
+            const width = this.sec_def.length + 1;
+            this._events = {};
+            for (let row = 0; row < this.count; row++) {
+                let event = {};
+                for (let i = 0; i < this.sec_def.length; i++) {
+                    event[this.sec_def[i][0]] = this.table[row * width + i + 1];
+                }
+                this._events[this.table[row * width]] = event;
+            }
+        }
+        return this._events;
+    }
 }
 
 class Rf extends IdSection {
@@ -117,72 +117,23 @@ class Pulseq {
                                     "ADC":0,
                                     "trap":
                                     {"Gx":0,"Gy":0,"Gz":0}};
-        for (var eventID in this.blocks.events)
+        var blockCache = new Map();
+        var table = this.blocks.table;
+        var width = this.blocks.sec_def.length + 1;
+        for (var row = 0; row < this.blocks.count; row++)
         {
-            var res = this.blocks.events[eventID];
-            if(res["delay"] != 0)
+            var b = row * width;
+            var res = {"delay": table[b + 1], "rf": table[b + 2],
+                       "gx": table[b + 3], "gy": table[b + 4],
+                       "gz": table[b + 5], "adc": table[b + 6]};
+            var key = table.subarray(b + 1, b + width).join(" ");
+            // Blocks with identical event IDs convert to identical entries,
+            // e.g. the readout of every line of a cartesian sequence
+            if (!blockCache.has(key))
             {
-                var delayValue = this.delays.events[res["delay"]]["delay"];
-                sequenceDist[currentIDX]["delay"] = delayValue  /globalScale
-            }
-            if(res["rf"]!=0)
-            {
-                var rfPuls = this.rf.events[res["rf"]];
-                var rfDist = {};
-                rfDist["delay"] = rfPuls["delay"] /globalScale;
-                var amp = rfPuls["amp"];
-                var mag = this.shapes.shapes[rfPuls["mag_id"]]["samples"];
-                var phase = this.shapes.shapes[rfPuls["phase_id"]]["samples"];
-                var angle = [];
-                mag.forEach((val, i, arr) => {
-                    angle.push(amp * mag[i] * 1e-6 * 360 )
-                })
-                rfDist["angle"] = resize(angle, 50 * gamma)
-                rfDist["phase"] = rfPuls["phase"] ///Math.PI;  +
-                rfDist["D_phase"] = resize_v2(phase, 50 * gamma) ///Math.PI;
-                sequenceDist[currentIDX]["RF"] = rfDist
-            }
-            if(res["gx"]!=0)
-            {
-                var g = this.trap.events[res["gx"]];
-                var gDist = {};
-                gDist["delay"] = g["delay"] /globalScale;
-                gDist["amplitude"] = g["amp"]/2000; //Unit trans: 1 Hz/m ->  1 Hz/mm
-                gDist["period"] = (g["rise"] + g["flat"] + g["fall"]) /globalScale;
-                sequenceDist[currentIDX]["trap"]["Gx"] = gDist;
-            }
-            if(res["gy"]!=0)
-            {
-                var g = this.trap.events[res["gy"]];
-                var gDist = {};
-                gDist["delay"] = g["delay"] /globalScale;
-                gDist["amplitude"] = g["amp"]/2000;
-                gDist["period"] = (g["rise"] + g["flat"] + g["fall"])/globalScale;
-                sequenceDist[currentIDX]["trap"]["Gy"] = gDist;
-            }
-            if(res["gz"]!=0)
-            {
-                var g = this.trap.events[res["gz"]];
-
-                var gDist = {};
-                gDist["delay"] = g["delay"] /globalScale;
-                gDist["amplitude"] = g["amp"];
-                gDist["period"] = (g["rise"] + g["flat"] + g["fall"]) /globalScale;
-                sequenceDist[currentIDX]["trap"]["Gz"] = gDist;
-            }
-            if(res["adc"]!=0)
-            {
-                var adc = this.adc.events[res["adc"]];
-                var adcDist = {};
-                adcDist["delay"] = adc["delay"] /globalScale;
-                adcDist["dwell"] = adc["dwell"] /1000 /globalScale;
-                adcDist["num"] = adc["num"]
-                adcDist["freq"] = adc["freq"];
-                adcDist["phase"] = adc["phase"];
-
-                // currentIDX+=1
-                sequenceDist[currentIDX]["ADC"] = adcDist
+                blockCache.set(key, this.blockDist(res, globalScale, gamma));
             }
+            sequenceDist[currentIDX] = blockCache.get(key);
             currentIDX+=1;
             sequenceDist[currentIDX] = {"delay":0,
             "RF":0,
@@ -192,6 +143,76 @@ class Pulseq {
         }
         return sequenceDist
     }
+
+    blockDist(res, globalScale, gamma){
+        var dist = {"delay":0,
+                    "RF":0,
+                    "ADC":0,
+                    "trap":
+                    {"Gx":0,"Gy":0,"Gz":0}};
+        if(res["delay"] != 0)
+        {
+            var delayValue = this.delays.events[res["delay"]]["delay"];
+            dist["delay"] = delayValue  /globalScale
+        }
+        if(res["rf"]!=0)
+        {
+            var rfPuls = this.rf.events[res["rf"]];
+            var rfDist = {};
+            rfDist["delay"] = rfPuls["delay"] /globalScale;
+            var amp = rfPuls["amp"];
+            var mag = this.shapes.shapes[rfPuls["mag_id"]]["samples"];
+            var phase = this.shapes.shapes[rfPuls["phase_id"]]["samples"];
+            var angle = [];
+            mag.forEach((val, i, arr) => {
+                angle.push(amp * mag[i] * 1e-6 * 360 )
+            })
+            rfDist["angle"] = resize(angle, 50 * gamma)
+            rfDist["phase"] = rfPuls["phase"] ///Math.PI;  +
+            rfDist["D_phase"] = resize_v2(phase, 50 * gamma) ///Math.PI;
+            dist["RF"] = rfDist
+        }
+        if(res["gx"]!=0)
+        {
+            var g = this.trap.events[res["gx"]];
+            var gDist = {};
+            gDist["delay"] = g["delay"] /globalScale;
+            gDist["amplitude"] = g["amp"]/2000; //Unit trans: 1 Hz/m ->  1 Hz/mm
+            gDist["period"] = (g["rise"] + g["flat"] + g["fall"]) /globalScale;
+            dist["trap"]["Gx"] = gDist;
+        }
+        if(res["gy"]!=0)
+        {
+            var g = this.trap.events[res["gy"]];
+            var gDist = {};
+            gDist["delay"] = g["delay"] /globalScale;
+            gDist["amplitude"] = g["amp"]/2000;
+            gDist["period"] = (g["rise"] + g["flat"] + g["fall"])/globalScale;
+            dist["trap"]["Gy"] = gDist;
+        }
+        if(res["gz"]!=0)
+        {
+            var g = this.trap.events[res["gz"]];
+
+            var gDist = {};
+            gDist["delay"] = g["delay"] /globalScale;
+            gDist["amplitude"] = g["amp"];
+            gDist["period"] = (g["rise"] + g["flat"] + g["fall"]) /globalScale;
+            dist["trap"]["Gz"] = gDist;
+        }
+        if(res["adc"]!=0)
+        {
+            var adc = this.adc.events[res["adc"]];
+            var adcDist = {};
+            adcDist["delay"] = adc["delay"] /globalScale;
+            adcDist["dwell"] = adc["dwell"] /1000 /globalScale;
+            adcDist["num"] = adc["num"]
+            adcDist["freq"] = adc["freq"];
+            adcDist["phase"] = adc["phase"];
+            dist["ADC"] = adcDist
+        }
+        return dist
+    }
 }
 
 function readString(input_string) {
@@ -0,0 +1,83 @@
+# %% S0. SETUP env
+import MRzeroCore as mr0
+import torch
+import time
+import resource
+import multiprocessing
+
+# makes the ex folder your working directory
+import os
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'True'
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+# Simulates the same sequence and phantom with mr0.isochromat_sim (spins per
+# voxel) and mr0.execute_graph (PDG) and reports wall time, peak memory and
+# the NRMSE of both signals. Both simulators run on the device of the SimData.
+
+# %% S1. SETUP sequence and phantom
+seq0 = mr0.Sequence.import_file('../data/out/flash.seq')
+
+sz = [32, 32]
+obj_p = mr0.VoxelGridPhantom.load_mat('../data/numerical_brain_cropped.mat')
+obj_p = obj_p.interpolate(sz[0], sz[1], 1)
+obj_p = obj_p.build()
+
+device = 'cuda' if torch.cuda.is_available() else 'cpu'
+if device == 'cuda':
+    seq0 = seq0.cuda()
+    obj_p = obj_p.cuda()
+
+spin_count = 1000
+
+# %% S2. BENCHMARK
+def isochromat(seq, data):
+    # depending on the MRzeroCore version, either the "rand" or the "r2" spin
+    # distribution fails with a shape mismatch of the spin positions
+    torch.manual_seed(0)
+    try:
+        return mr0.isochromat_sim(seq, data, spin_count, print_progress=False)
+    except RuntimeError:
+        return mr0.isochromat_sim(seq, data, spin_count, print_progress=False,
+                                  spin_dist='r2', r2_seed=torch.tensor([0.5, 0.5, 0.5]))
+
+
+def pdg(seq, data):
+    graph = mr0.compute_graph(seq, data, 200, 1e-3)
+    return mr0.execute_graph(graph, seq, data, print_progress=False)
+
+
+def measure(func):
+    # runs in a fresh process so the peak memory of one simulator is not
+    # hidden by the other; returns (wall time [s], peak memory [MiB], signal)
+    if device == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with torch.no_grad():
+        signal = func(seq0, obj_p)
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    wall = time.perf_counter() - start
+    if device == 'cuda':
+        peak = torch.cuda.max_memory_allocated() / 2**20
+    else:  # ru_maxrss is in KiB on Linux
+        peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start) / 2**10
+    return wall, peak, signal.cpu()
+
+
+if __name__ == '__main__':
+    # CUDA cannot be re-initialized in a forked child
+    ctx = multiprocessing.get_context('spawn' if device == 'cuda' else 'fork')
+    results = {}
+    for name, func in [('isochromat_sim', isochromat), ('execute_graph', pdg)]:
+        with ctx.Pool(1) as pool:
+            results[name] = pool.apply(measure, (func,))
+
+    print(f'{device}, {obj_p.PD.numel()} voxels, {len(seq0)} repetitions, {spin_count} spins per voxel')
+    for name, (wall, peak, _) in results.items():
+        print(f'{name:>15}: {wall:.3f} s, peak memory +{peak:.1f} MiB')
+    signal_iso = results['isochromat_sim'][2]
+    signal_pdg = results['execute_graph'][2]
+    nrmse = ((signal_iso - signal_pdg).norm() / signal_pdg.norm()).item()
+    print(f'signal NRMSE: {nrmse:.3f}')
@@ -0,0 +1,47 @@
+# %% S0. SETUP env
+import MRzeroCore as mr0
+import util
+import torch
+import time
+
+# makes the ex folder your working directory
+import os
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'True'
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+# Compares mr0.execute_graph with util.parallel_execute_graph (voxel shards in
+# worker processes) and reports the speed-up per number of workers.
+
+# %% S1. SETUP sequence and phantom
+seq0 = mr0.Sequence.import_file('../data/out/flash.seq')
+
+sz = [96, 96]
+obj_p = mr0.VoxelGridPhantom.load_mat('../data/numerical_brain_cropped.mat')
+obj_p = obj_p.interpolate(sz[0], sz[1], 1)
+obj_p = obj_p.build()
+
+worker_counts = [w for w in [2, 4, 8, 16, 32] if w <= os.cpu_count()] or [2]
+repeats = 3
+
+# %% S2. BENCHMARK
+def timed(func):
+    # best of several runs, graph is recomputed as execute_graph changes it
+    best = float('inf')
+    for _ in range(repeats):
+        graph = mr0.compute_graph(seq0, obj_p, 200, 1e-3)
+        start = time.perf_counter()
+        signal = func(graph)
+        best = min(best, time.perf_counter() - start)
+    return best, signal
+
+with torch.no_grad():
+    t_single, signal_ref = timed(
+        lambda graph: mr0.execute_graph(graph, seq0, obj_p, print_progress=False))
+
+    print(f'{os.cpu_count()} CPUs, {obj_p.PD.numel()} voxels, {len(seq0)} repetitions')
+    print(f'single process: {t_single:.3f} s')
+    for workers in worker_counts:
+        t, signal = timed(
+            lambda graph: util.parallel_execute_graph(graph, seq0, obj_p, workers=workers))
+        err = ((signal - signal_ref).abs().max() / signal_ref.abs().max()).item()
+        print(f'{workers:3d} workers: {t:.3f} s, speed-up {t_single / t:.2f}, max. rel. error {err:.1e}')
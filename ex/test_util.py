@@ -0,0 +1,156 @@
+import os
+import shutil
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+mr0 = pytest.importorskip('MRzeroCore')
+pytest.importorskip('pypulseq')
+import util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def assert_same_attrs(a, b):
+    assert vars(a).keys() == vars(b).keys()
+    for name, value in vars(a).items():
+        if name == 'pulse':
+            assert_same_attrs(value, vars(b)[name])
+        elif isinstance(value, torch.Tensor):
+            assert value.dtype == vars(b)[name].dtype
+            assert torch.equal(value, vars(b)[name])
+        elif isinstance(value, dict):
+            assert value.keys() == vars(b)[name].keys()
+            assert all(torch.equal(value[k], vars(b)[name][k]) for k in value)
+        else:
+            assert type(value) is type(vars(b)[name])
+            assert value == vars(b)[name]
+
+
+def no_import(*args, **kwargs):
+    raise AssertionError('import_file called on a cache hit')
+
+
+@pytest.mark.parametrize('seq_file', [
+    'BlochSimWeb/seq/out/web3_FLASH_16.seq',
+    'data/out/flash pTx CP.seq',
+])
+def test_import_seq_cached(tmp_path, monkeypatch, seq_file):
+    path = str(tmp_path / 'external.seq')
+    shutil.copy(os.path.join(ROOT, seq_file), path)
+    seq = mr0.Sequence.import_file(path)
+
+    util.import_seq_cached(path)  # writes the sidecar
+    assert sorted(os.listdir(tmp_path)) == ['external.seq', 'external.seq.npz']
+    monkeypatch.setattr(mr0.Sequence, 'import_file', no_import)
+    cached = util.import_seq_cached(path)  # reads the sidecar
+
+    assert vars(cached) == vars(seq)
+    assert len(cached) == len(seq)
+    for rep_c, rep in zip(cached, seq):
+        assert_same_attrs(rep_c, rep)
+
+
+def test_import_seq_cached_options(tmp_path):
+    path = str(tmp_path / 'external.seq')
+    shutil.copy(os.path.join(ROOT, 'BlochSimWeb/seq/out/web3_FLASH_16.seq'), path)
+
+    util.import_seq_cached(path, exact_trajectories=True)
+    cached = util.import_seq_cached(path, exact_trajectories=False)
+    seq = mr0.Sequence.import_file(path, exact_trajectories=False)
+    assert [rep.event_count for rep in cached] == [rep.event_count for rep in seq]
+
+
+def test_import_seq_cached_broken_sidecar(tmp_path):
+    path = str(tmp_path / 'external.seq')
+    shutil.copy(os.path.join(ROOT, 'BlochSimWeb/seq/out/web3_FLASH_16.seq'), path)
+    util.import_seq_cached(path)
+
+    # A truncated sidecar (e.g. interrupted write) is a cache miss ...
+    with open(path + '.npz', 'r+b') as f:
+        f.truncate(100)
+    seq = util.import_seq_cached(path)
+    assert len(seq) == len(mr0.Sequence.import_file(path))
+    # ... and gets replaced by a valid one
+    with np.load(path + '.npz') as cache:
+        assert 'key' in cache
+
+
+def test_graph_stats():
+    seq = mr0.Sequence.import_file(
+        os.path.join(ROOT, 'BlochSimWeb/seq/out/web3_FLASH_16.seq'))
+    obj_p = mr0.VoxelGridPhantom.load_mat(
+        os.path.join(ROOT, 'data/numerical_brain_cropped.mat'))
+    data = obj_p.interpolate(16, 16, 1).build()
+    graph = mr0.compute_graph(seq, data, 200, 1e-3)
+
+    stats = util.graph_stats(graph, seq, data)
+    state_count = stats['states_+'] + stats['states_z'] + stats['states_z0']
+    assert state_count.tolist() == [len(dists) for dists in graph[1:]]
+    assert (stats['measured'] <= stats['states_+']).all()
+    assert ((0 <= stats['rel_lost_signal']) & (stats['rel_lost_signal'] <= 1)).all()
+
+    # Without thresholds every state is simulated and every + state measured
+    stats = util.graph_stats(graph, seq, data, 0, 0)
+    assert (stats['skipped'] == 0).all()
+    assert (stats['measured'] == stats['states_+']).all()
+    assert (stats['lost_signal'] == 0).all()
+    assert stats['flops'].sum() == sum(
+        len(dists) * rep.event_count for dists, rep in zip(graph[1:], seq)
+    ) * data.PD.numel()
+
+
+def test_parallel_execute_graph():
+    seq = mr0.Sequence.import_file(
+        os.path.join(ROOT, 'BlochSimWeb/seq/out/web3_FLASH_16.seq'))
+    obj_p = mr0.VoxelGridPhantom.load_mat(
+        os.path.join(ROOT, 'data/numerical_brain_cropped.mat'))
+    data = obj_p.interpolate(16, 16, 1).build()
+
+    graph = mr0.compute_graph(seq, data, 200, 1e-3)
+    signal = mr0.execute_graph(graph, seq, data, print_progress=False)
+    graph = mr0.compute_graph(seq, data, 200, 1e-3)
+    signal_parallel = util.parallel_execute_graph(graph, seq, data, workers=3)
+    assert torch.allclose(signal_parallel, signal, rtol=1e-4, atol=1e-6)
+
+
+def test_parallel_execute_graph_fallback():
+    seq = mr0.Sequence.import_file(
+        os.path.join(ROOT, 'BlochSimWeb/seq/out/web3_FLASH_16.seq'))
+    obj_p = mr0.VoxelGridPhantom.load_mat(
+        os.path.join(ROOT, 'data/numerical_brain_cropped.mat'))
+    data = obj_p.interpolate(8, 8, 1).build()
+
+    # Gradients need the single process path
+    for rep in seq:
+        rep.pulse.angle = torch.as_tensor(rep.pulse.angle).requires_grad_()
+    graph = mr0.compute_graph(seq, data, 200, 1e-3)
+    signal = util.parallel_execute_graph(graph, seq, data, workers=2)
+    signal.abs().sum().backward()
+    assert seq[0].pulse.angle.grad is not None
+
+    # Arguments that change the return type are passed on unchanged
+    with torch.no_grad():
+        graph = mr0.compute_graph(seq, data, 200, 1e-3)
+        args = {'return_mag_z': True} if 'return_mag_z' in \
+            mr0.execute_graph.__code__.co_varnames else {'return_mag_adc': True}
+        result = util.parallel_execute_graph(graph, seq, data, workers=2, print_progress=False, **args)
+    assert isinstance(result, (tuple, list))
+
+
+def test_chunked_execute_graph():
+    seq = mr0.Sequence.import_file(
+        os.path.join(ROOT, 'BlochSimWeb/seq/out/web3_FLASH_16.seq'))
+    obj_p = mr0.VoxelGridPhantom.load_mat(
+        os.path.join(ROOT, 'data/numerical_brain_cropped.mat'))
+    data = obj_p.interpolate(16, 16, 1).build()
+
+    graph = mr0.compute_graph(seq, data, 200, 1e-3)
+    signal = mr0.execute_graph(graph, seq, data, print_progress=False)
+    # The chunks reuse one graph, the last one is smaller than the others
+    graph = mr0.compute_graph(seq, data, 200, 1e-3)
+    signal_chunked = util.chunked_execute_graph(graph, seq, data, 50)
+    assert torch.allclose(signal_chunked, signal, rtol=1e-4, atol=1e-6)
+
+    with pytest.raises(ValueError):
+        util.chunked_execute_graph(graph, seq, data, 50, return_mag_z=True)
@@ -1,6 +1,13 @@
 import os 
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'True'
 import time
+import hashlib
+import importlib.metadata
+import multiprocessing
+import copy
+import enum
+import warnings
+import zipfile
 import torch
 import numpy as np
 
@@ -44,6 +51,326 @@ def get_signal_from_real_system(path, NRep, NCol):
     return torch.tensor(raw, dtype=torch.complex64)
 
 
+def import_seq_cached(path, **import_args):
+    """
+    Import a .seq file like `mr0.Sequence.import_file`, but keep the converted
+    sequence in a binary sidecar file (path + '.npz').
+    The sidecar stores every attribute of the sequence, its repetitions and
+    their pulses (event_time, gradm, adc_phase, adc_usage, angle, phase,
+    shim_array, ...): tensors of all repetitions are concatenated with their
+    shapes stored alongside, python scalars and enums as arrays. It is keyed
+    by a hash of the .seq text, the installed MRzeroCore version and the
+    import arguments, so it is only used as long as none of them changed;
+    otherwise (or if it can't be read) the file is imported again and the
+    sidecar rewritten. If the installed MRzeroCore version uses attribute
+    types that can't be stored, a warning is printed and no sidecar is written.
+    Parameters
+    ----------
+    path : str
+        Path to the .seq file, e.g. 'out/external.seq'.
+    import_args :
+        Passed on to `mr0.Sequence.import_file`, e.g. exact_trajectories.
+    """
+    import MRzeroCore as mr0
+
+    key = hashlib.sha1()
+    with open(path, 'rb') as f:
+        key.update(f.read())
+    key.update(f"MRzeroCore {importlib.metadata.version('MRzeroCore')}".encode())
+    for name, value in sorted(import_args.items()):
+        if isinstance(value, torch.Tensor):
+            value = value.tolist()
+        key.update(f', {name}={value!r}'.encode())
+    key = key.hexdigest()
+    cache_path = path + '.npz'
+
+    if os.path.isfile(cache_path):
+        try:
+            with np.load(cache_path) as cache:
+                if str(cache['key']) == key:
+                    return _sequence_from_cache(cache)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            pass  # incomplete or outdated sidecar, import again
+
+    seq = mr0.Sequence.import_file(path, **import_args)
+    try:
+        arrays = _sequence_to_cache(seq)
+    except TypeError as e:
+        warnings.warn(f'import_seq_cached: no sidecar written for {path}: {e}')
+        return seq
+
+    # Write to a temporary file first so that an interrupted write or a
+    # concurrent import never leaves a broken sidecar behind
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, key=key, **arrays)
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return seq
+
+
+def _sequence_to_cache(seq):
+    # Every stored attribute is listed in 'fields' as 'owner:name:kind', where
+    # owner is seq, rep or pulse and kind says how to restore it
+    arrays = {'offsets': np.cumsum([0] + [rep.event_count for rep in seq])}
+    fields = []
+
+    def store(owner, name, values):
+        prefix = f'{owner}:{name}'
+        first = values[0]
+        if isinstance(first, torch.Tensor) and all(isinstance(v, torch.Tensor) and v.ndim == first.ndim for v in values):
+            arrays[prefix] = torch.cat([v.detach().cpu().reshape(-1) for v in values]).numpy()
+            arrays[prefix + ':shape'] = np.array([v.shape for v in values], dtype=np.int64).reshape(len(values), first.ndim)
+            fields.append(prefix + ':tensor')
+        elif isinstance(first, enum.Enum) and all(type(v) is type(first) for v in values):
+            arrays[prefix] = np.array([v.value for v in values])
+            fields.append(f'{prefix}:enum.{type(first).__name__}')
+        elif type(first) in (bool, int, float) and all(type(v) is type(first) for v in values):
+            arrays[prefix] = np.array(values)
+            fields.append(f'{prefix}:{type(first).__name__}')
+        elif isinstance(first, dict) and all(isinstance(v, dict) and v.keys() == first.keys() for v in values):
+            fields.append(prefix + ':dict')
+            for key in first:
+                store(owner, f'{name}.{key}', [v[key] for v in values])
+        else:
+            raise TypeError(f"can't store {owner}.{name} of type {type(first).__name__}")
+
+    for name, value in vars(seq).items():
+        store('seq', name, [value])
+    for owner, objects in [('rep', list(seq)), ('pulse', [rep.pulse for rep in seq])]:
+        names = vars(objects[0]).keys() - {'pulse', 'event_count'}
+        if any(vars(obj).keys() - {'pulse', 'event_count'} != names for obj in objects):
+            raise TypeError(f'{owner} attributes differ between repetitions')
+        for name in sorted(names):
+            store(owner, name, [getattr(obj, name) for obj in objects])
+
+    arrays['fields'] = np.array(fields)
+    return arrays
+
+
+def _sequence_from_cache(cache):
+    import MRzeroCore as mr0
+
+    offsets = cache['offsets']
+    rep_count = len(offsets) - 1
+    values = {}  # (owner, name) -> list of values, one per repetition
+    for field in cache['fields']:
+        owner, field = str(field).split(':', 1)
+        name, kind = field.rsplit(':', 1)
+        prefix = f'{owner}:{name}'
+        if kind == 'tensor':
+            # The tensors are views into the concatenated arrays
+            data = torch.from_numpy(cache[prefix])
+            shapes = cache[prefix + ':shape']
+            sizes = np.prod(shapes, axis=1, dtype=np.int64)
+            starts = np.cumsum(sizes) - sizes
+            values[owner, name] = [data[start:start + size].reshape(tuple(shape))
+                                   for shape, start, size in zip(shapes, starts, sizes)]
+        elif kind.startswith('enum.'):
+            enum_type = getattr(mr0, kind[len('enum.'):])
+            values[owner, name] = [enum_type(str(v)) for v in cache[prefix]]
+        elif kind == 'dict':
+            values[owner, name] = [{} for _ in range(1 if owner == 'seq' else rep_count)]
+        else:
+            to_type = {'bool': bool, 'int': int, 'float': float}[kind]
+            values[owner, name] = [to_type(v) for v in cache[prefix]]
+
+    # Fill dicts with their entries, which are stored as 'name.key'
+    for (owner, name), vals in list(values.items()):
+        if '.' in name:
+            parent, key = name.rsplit('.', 1)
+            for i, v in enumerate(vals):
+                values[owner, parent][i][key] = v
+            del values[owner, name]
+
+    seq = mr0.Sequence()
+    for i in range(rep_count):
+        rep = seq.new_rep(int(offsets[i + 1] - offsets[i]))
+        for (owner, name), vals in values.items():
+            if owner == 'rep':
+                setattr(rep, name, vals[i])
+            elif owner == 'pulse':
+                setattr(rep.pulse, name, vals[i])
+    for (owner, name), vals in values.items():
+        if owner == 'seq':
+            setattr(seq, name, vals[0])
+    return seq
+
+
+def graph_stats(graph, seq, data, min_emitted_signal=1e-2, min_latent_signal=1e-2):
+    """
+    Per-repetition statistics of a graph from `mr0.compute_graph`, to judge
+    the max_state_count / threshold settings before running `mr0.execute_graph`.
+    The thresholds are the ones of `mr0.execute_graph` (MRzeroCore 0.2.6 to
+    0.3.0): non-z0 states with latent_signal < min_latent_signal are not
+    simulated, simulated '+' states with emitted_signal >= min_emitted_signal
+    are measured. States skipped only because none of their ancestors were
+    simulated are not detected and count as simulated.
+    Parameters
+    ----------
+    graph : mr0.Graph
+        Graph computed for seq.
+    seq : mr0.Sequence
+        Sequence the graph was computed for.
+    data : mr0.SimData
+        Phantom data the graph will be executed with.
+    Returns
+    -------
+    dict of np.ndarray, one entry per repetition:
+        'states_+', 'states_z', 'states_z0': states per dist_type
+        'skipped': states not simulated because of min_latent_signal
+        'measured': '+' states that contribute to the signal
+        'lost_signal': summed emitted_signal of '+' states that are not measured
+        'rel_lost_signal': lost_signal relative to the emitted_signal of all '+' states
+        'flops': simulated states x events x voxels, a proxy for the main pass cost
+    """
+    # graph[0] only contains the initial z0 state, graph[i + 1] belongs to seq[i]
+    rep_count = len(seq)
+    types = ['+', 'z', 'z0']
+    rep_idx, dist_type, latent, emitted = [], [], [], []
+    for r, dists in enumerate(graph[1:]):
+        for dist in dists:
+            rep_idx.append(r)
+            dist_type.append(types.index(dist.dist_type))
+            latent.append(dist.latent_signal)
+            emitted.append(dist.emitted_signal)
+    rep_idx = np.asarray(rep_idx, dtype=np.int64)
+    dist_type = np.asarray(dist_type, dtype=np.int64)
+    latent = np.asarray(latent, dtype=np.float64)
+    emitted = np.asarray(emitted, dtype=np.float64)
+
+    is_p = dist_type == types.index('+')
+    skipped = (dist_type != types.index('z0')) & (latent < min_latent_signal)
+    measured = is_p & ~skipped & (emitted >= min_emitted_signal)
+
+    def per_rep(weights):
+        return np.bincount(rep_idx, weights=weights, minlength=rep_count)
+
+    stats = {f'states_{t}': per_rep(dist_type == i).astype(np.int64)
+             for i, t in enumerate(types)}
+    stats['skipped'] = per_rep(skipped).astype(np.int64)
+    stats['measured'] = per_rep(measured).astype(np.int64)
+    stats['lost_signal'] = per_rep(np.where(is_p & ~measured, emitted, 0))
+    total_signal = per_rep(np.where(is_p, emitted, 0))
+    stats['rel_lost_signal'] = np.divide(
+        stats['lost_signal'], total_signal,
+        out=np.zeros(rep_count), where=total_signal > 0)
+    event_count = np.array([rep.event_count for rep in seq], dtype=np.int64)
+    simulated = per_rep(~skipped).astype(np.int64)
+    stats['flops'] = simulated * event_count * data.PD.numel()
+    return stats
+
+
+def parallel_execute_graph(graph, seq, data, workers=None, **kwargs):
+    """
+    Run `mr0.execute_graph` on voxel shards of data in a pool of worker
+    processes and sum the per-shard signals, which gives the same signal as a
+    single call since the signal is linear in the voxels once the graph is
+    fixed. Useful on many-core CPUs without GPU.
+    The graph holds prepass states that can't be pickled, so the workers are
+    started with 'fork' and inherit graph, seq and data from this process
+    (the phantom tensors are shared copy-on-write, not copied).
+    The sharded path never carries gradients. It falls back to a single
+    `mr0.execute_graph` call if autograd would be needed (grad mode enabled
+    and any tensor of seq or data requires grad), where 'fork' is not
+    available (Windows), for data on the GPU, with voxel_motion, or if kwargs
+    other than min_emitted_signal / min_latent_signal / print_progress are
+    given (e.g. return_mag_z, which changes the return type).
+    ex/bench_parallel_execute_graph.py measures the speed-up.
+    Parameters
+    ----------
+    graph, seq, data :
+        As for `mr0.execute_graph`.
+    workers : int
+        Number of worker processes, defaults to os.cpu_count().
+    kwargs :
+        Passed on to `mr0.execute_graph`, e.g. min_emitted_signal.
+    """
+    import MRzeroCore as mr0
+
+    global _parallel_args
+    workers = workers or os.cpu_count()
+    if (workers <= 1 or data.device.type != 'cpu' or data.voxel_motion is not None
+            or 'fork' not in multiprocessing.get_all_start_methods()
+            or not kwargs.keys() <= {'min_emitted_signal', 'min_latent_signal', 'print_progress'}
+            or torch.is_grad_enabled() and _requires_grad(seq, data)):
+        return mr0.execute_graph(graph, seq, data, **kwargs)
+
+    kwargs['print_progress'] = False
+    shards = torch.arange(data.PD.numel()).tensor_split(workers)
+    threads = max(1, torch.get_num_threads() // workers)
+    _parallel_args = (graph, seq, data, threads, kwargs)
+    try:
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            signals = pool.map(_execute_shard, shards)
+    finally:
+        _parallel_args = None
+    return sum(signals)
+
+
+def chunked_execute_graph(graph, seq, data, voxel_chunk_size, **kwargs):
+    """
+    Run `mr0.execute_graph` one after another on chunks of voxel_chunk_size
+    voxels of data and sum the signals. The events x voxels tensors of the
+    main pass then only exist for one chunk at a time, so peak memory is
+    about O(events x voxel_chunk_size) instead of O(events x voxels), at the
+    cost of walking the graph once per chunk. The signal equals a single call
+    up to float rounding of the sum, and autograd works as usual.
+    Parameters
+    ----------
+    graph, seq, data :
+        As for `mr0.execute_graph`.
+    voxel_chunk_size : int
+        Number of voxels simulated at once.
+    kwargs :
+        min_emitted_signal, min_latent_signal and print_progress (default
+        False) are passed on to `mr0.execute_graph`. Other arguments like
+        return_mag_z return per-voxel data and are not supported.
+    """
+    import MRzeroCore as mr0
+
+    if not kwargs.keys() <= {'min_emitted_signal', 'min_latent_signal', 'print_progress'}:
+        raise ValueError(f'chunked_execute_graph does not support {sorted(kwargs.keys())}')
+    kwargs.setdefault('print_progress', False)
+
+    signal = 0
+    for idx in torch.arange(data.PD.numel()).split(voxel_chunk_size):
+        signal = signal + mr0.execute_graph(graph, seq, _voxel_shard(data, idx), **kwargs)
+    return signal
+
+
+_parallel_args = None
+
+
+def _execute_shard(idx):
+    import MRzeroCore as mr0
+
+    graph, seq, data, threads, kwargs = _parallel_args
+    torch.set_num_threads(threads)
+    return mr0.execute_graph(graph, seq, _voxel_shard(data, idx), **kwargs)
+
+
+def _voxel_shard(data, idx):
+    # Copy of data that only contains the voxels idx. Only the per-voxel
+    # tensors are sliced, everything else (size, nyquist, dephasing_func, ...)
+    # is shared, which keeps this independent of the SimData constructor.
+    shard = copy.copy(data)
+    for name in ['PD', 'T1', 'T2', 'T2dash', 'D', 'B0', 'voxel_pos']:
+        setattr(shard, name, getattr(data, name)[idx])
+    for name in ['B1', 'coil_sens']:
+        setattr(shard, name, getattr(data, name)[:, idx])
+    return shard
+
+
+def _requires_grad(seq, data):
+    objects = [data] + [rep for rep in seq] + [rep.pulse for rep in seq]
+    return any(isinstance(v, torch.Tensor) and v.requires_grad
+               for obj in objects for v in vars(obj).values())
+
+
 # This plot function is a modified version from the one provided by
 # pypulseq 1.2.0post1, all changes are marked
 def pulseq_plot(seq: Sequence, type: str = 'Gradient', time_range=(0, np.inf), time_disp: str = 's', clear=False, signal=0, figid=(1,2)):